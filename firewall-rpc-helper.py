@@ -30,6 +30,18 @@ import subprocess
 import random
 import textwrap
 import errno
+import re
+
+# splits a single KEY=value assignment line in a sysconfig file. The value
+# is passed on verbatim, quotes are dealt with by scanPort().
+_CFG_LINE_RE = re.compile(r'^\s*([A-Za-z_]\w*)\s*=(.*)$')
+# matches the first purely numeric word in a sysconfig value
+_PORT_RE = re.compile(r'(?<![^\s"])\d+(?![^\s"])')
+# matches a single "program vers proto port service" line of rpcinfo -p
+_RPCINFO_RE = re.compile(
+	r'^\s*(\d+)\s+(\d+)\s+(tcp|udp)\s+(\d+)\s+(\S+)\s*$',
+	re.MULTILINE
+)
 
 def error(*args, **kwargs):
 	kwargs["file"] = sys.stderr
@@ -63,6 +75,9 @@ class FirewallRPC(object):
 		"YPXFRD_ARGS": "fypxfrd",
 	}
 
+	# all known rpcbind service names for quick lookup
+	cfg_service_set = frozenset(cfg_service_names.values())
+
 	class NoArgValue(object):
 		pass
 
@@ -75,20 +90,16 @@ class FirewallRPC(object):
 				static_ports = []):
 
 			self.m_label = label
-			self.m_sysconfig_file = "/etc/sysconfig/{}".format(
-				sysconfig_file
-			)
+			self.m_sysconfig_file = f"/etc/sysconfig/{sysconfig_file}"
 			self.m_config_vars = config_vars
-			self.m_rpcbind_services = set()
 			self.m_static_ports = static_ports
 
 			cfg_service_names = FirewallRPC.cfg_service_names
 
-			for config in self.m_config_vars:
-				self.m_rpcbind_services.add(
-					cfg_service_names[config]
-				)
-			self.m_rpcbind_services = list(self.m_rpcbind_services)
+			self.m_rpcbind_services = frozenset(
+				cfg_service_names[config]
+				for config in self.m_config_vars
+			)
 
 		def isInstalled(self):
 			return os.path.exists(self.m_sysconfig_file)
@@ -96,6 +107,16 @@ class FirewallRPC(object):
 	def __init__(self):
 
 		self.m_used_ports = set()
+		# environment for child processes, avoid translations or
+		# special encodings
+		self.m_child_env = os.environ.copy()
+		self.m_child_env["LC_ALL"] = "C"
+		self.m_firewalld_running = None
+		# lazily determined on first access of m_rpc_services
+		self.m_rpc_services_cache = None
+		self.m_all_used_ports_cache = None
+		# maps sysconfig file paths to their parsed key=port items
+		self.m_cfg_cache = {}
 		self.setupPatterns()
 
 		self.m_parser = argparse.ArgumentParser(
@@ -286,8 +307,6 @@ applicable (currently only firewall-cmd calls)."""),
 		"""The main entry point of the tool."""
 
 		self.m_args = self.m_parser.parse_args()
-		# always determine the currently assigned rpc ports
-		self.m_rpc_services = self.getRPCServices()
 
 		self.parsePortConfig()
 
@@ -337,24 +356,21 @@ applicable (currently only firewall-cmd calls)."""),
 		conditions the program will be exited."""
 		parts = config.split('=')
 		if len(parts) != 2:
-			error("Invalid port configuration encountered: '{}'. "\
-				"Expected '{}'.".format(
-					config,
-					"<rpcservice>=<port>"
-			))
+			error(f"Invalid port configuration encountered: '{config}'. "\
+				"Expected '<rpcservice>=<port>'.")
 			sys.exit(1)
 
 		rpcservice, port = parts
 
-		if rpcservice not in self.cfg_service_names.values():
+		if rpcservice not in self.cfg_service_set:
 			error("Unknown rpc service encountered in port "\
-				"configuration: '{}'".format(rpcservice))
+				f"configuration: '{rpcservice}'")
 			sys.exit(1)
 
 		port = self.validatePortString(port)
 		if not port:
 			error("Bad port encountered in port "\
-				"configuration: '{}'".format(config))
+				f"configuration: '{config}'")
 			sys.exit(1)
 
 		self.m_port_config[rpcservice] = port
@@ -369,7 +385,7 @@ applicable (currently only firewall-cmd calls)."""),
 
 		pattern = self.m_patterns.get(the_pattern, None)
 		if not pattern:
-			error("Unknown pattern '{}'".format(the_pattern))
+			error(f"Unknown pattern '{the_pattern}'")
 			error("Supported patterns:",
 				' '.join(self.getSupportedPatterns()))
 			sys.exit(1)
@@ -388,35 +404,30 @@ applicable (currently only firewall-cmd calls)."""),
 		rpcinfo = "/sbin/rpcinfo"
 
 		if not os.path.isfile(rpcinfo):
-			error("No rpcinfo program found in {}.".format(rpcinfo))
+			error(f"No rpcinfo program found in {rpcinfo}.")
 			sys.exit(1)
 
-		env = os.environ.copy()
-		# avoid translations or special encodings
-		env["LC_ALL"] = "C"
-
-		proc = subprocess.Popen(
+		proc = subprocess.run(
 			[ rpcinfo, "-p" ],
 			shell = False,
 			close_fds = True,
-			env = env,
+			env = self.m_child_env,
 			stdout = subprocess.PIPE,
-			stderr = subprocess.STDOUT
+			stderr = subprocess.STDOUT,
+			check = False
 		)
 
-		output = proc.stdout.read().decode()
+		output = proc.stdout.decode()
 
-		res = proc.wait()
-
-		if res != 0:
+		if proc.returncode != 0:
 			# if portmapper is not running at all we have to be
 			# robust
-			if output.find("can't contact portmapper") != -1:
+			if "can't contact portmapper" in output:
 				return None
 
 			print(output)
 
-			raise Exception("Failed to run {}".format(rpcinfo))
+			raise Exception(f"Failed to run {rpcinfo}")
 
 		return output
 
@@ -439,15 +450,12 @@ applicable (currently only firewall-cmd calls)."""),
 		if output is None:
 			return ports
 
-		skipped_header = False
+		# skip the header line
+		body = output[output.find('\n') + 1:]
 
-		for line in output.splitlines():
-
-			if not skipped_header:
-				skipped_header = True
-				continue
+		for m in _RPCINFO_RE.finditer(body):
 
-			prog, version, proto, port, service = line.split()
+			prog, version, proto, port, service = m.groups()
 
 			service = ports.setdefault(service, dict())
 			proto = service.setdefault(proto, set())
@@ -455,26 +463,49 @@ applicable (currently only firewall-cmd calls)."""),
 
 		return ports
 
-	def printServices(self, services):
-		"""Prints the ports assigned to the given rpc service
-		names."""
+	@property
+	def m_rpc_services(self):
+		"""The currently assigned rpcbind ports as returned from
+		getRPCServices(). rpcinfo is only invoked on first access."""
 
-		specs = []
+		if self.m_rpc_services_cache is None:
+			self.m_rpc_services_cache = self.getRPCServices()
 
-		for service, protos in self.m_rpc_services.items():
+		return self.m_rpc_services_cache
 
-			if service not in services:
-				continue
+	@property
+	def m_all_used_ports(self):
+		"""A flat set of all ports currently assigned to any rpcbind
+		service, regardless of protocol."""
+
+		if self.m_all_used_ports_cache is None:
+			self.m_all_used_ports_cache = {
+				port
+				for protos in self.m_rpc_services.values()
+				for portset in protos.values()
+				for port in portset
+			}
 
-			for proto, portset in protos.items():
-				for port in portset:
-					specs.append((proto, port))
+		return self.m_all_used_ports_cache
 
-		# filter out duplicates (can happen e.g. with nfs and nfs_acl)
-		specs = list(set(specs))
-		# sort by port number
-		specs = sorted(specs, key = lambda s: s[1])
-		tuples = [ '{}/{}'.format(port, proto) for proto, port in specs ]
+	def printServices(self, services):
+		"""Prints the ports assigned to the given rpc service
+		names."""
+
+		services = set(services)
+
+		# the set filters out duplicates (can happen e.g. with nfs and
+		# nfs_acl), then sort by port number
+		specs = sorted({
+				(proto, port)
+				for service, protos in self.m_rpc_services.items()
+				if service in services
+				for proto, portset in protos.items()
+				for port in portset
+			},
+			key = lambda s: s[1]
+		)
+		tuples = [ f'{port}/{proto}' for proto, port in specs ]
 
 		print(' '.join(tuples))
 
@@ -520,11 +551,7 @@ applicable (currently only firewall-cmd calls)."""),
 			]
 			table_rows.append(row)
 
-		column_widths = []
-
-		for column in range(len(heading_row)):
-			widths = [ len(row[column]) for row in table_rows ]
-			column_widths.append(max(widths))
+		column_widths = [ max(map(len, col)) for col in zip(*table_rows) ]
 
 		# heading row
 		print("| ", end = '')
@@ -551,22 +578,22 @@ applicable (currently only firewall-cmd calls)."""),
 		lines = []
 
 		print("Performing configuration of static ports for "
-			"{} pattern".format(self.m_pattern.m_label))
+			f"{self.m_pattern.m_label} pattern")
 
 		print()
 		if not self.m_args.non_interactive:
 			warning = self.getWrapped(
 				"WARNING: This process may overwrite custom "\
 				"configuration of service command line "\
-				"switches in {}".format(cfg))
+				f"switches in {cfg}")
 			print(warning)
 			print()
 
-		print("Reading current configuration from {}.".format(cfg))
+		print(f"Reading current configuration from {cfg}.")
 		print()
 		try:
 			with open(cfg, 'r') as cfg_fd:
-				for line in cfg_fd.readlines():
+				for line in cfg_fd:
 					line = self.processCfgLine(
 						line,
 						item_handler =
@@ -580,9 +607,11 @@ applicable (currently only firewall-cmd calls)."""),
 			else:
 				raise
 
-		print("Writing updated configuration to {}.".format(cfg))
+		print(f"Writing updated configuration to {cfg}.")
 		with open(cfg, 'w') as cfg_fd:
-			cfg_fd.write(''.join(lines))
+			cfg_fd.writelines(lines)
+		# the cached parse result is stale now
+		self.m_cfg_cache.pop(cfg, None)
 		print()
 		print("You will need to restart affected services for the "\
 			"changes to take effect.")
@@ -595,14 +624,8 @@ applicable (currently only firewall-cmd calls)."""),
 		LOCKD_UDPPORT, differentation between protocols would be
 		necessary)."""
 
-		if port in self.m_used_ports:
-			return True
-
-		for service, prots in self.m_rpc_services.items():
-			if port in prots:
-				return True
-
-		return False
+		return port in self.m_used_ports or \
+			port in self.m_all_used_ports
 
 	def getPortSyntax(self, config_var):
 		 return self.cfg_syntax.get(config_var, "{port}")
@@ -666,23 +689,13 @@ applicable (currently only firewall-cmd calls)."""),
 		the new configuration file in the end.
 		"""
 
-		stripped = line.strip()
+		m = _CFG_LINE_RE.match(line)
 
-		if not stripped:
-			# empty line
-			return line
-		elif stripped.startswith('#'):
-			# comment
-			return line
-
-		parts = stripped.split('=')
-		if len(parts) != 2:
-			# no key/value pair
+		if not m:
+			# empty line, comment or no key/value pair
 			return line
 
-		key, val = parts
-
-		new_line = item_handler(key, val)
+		new_line = item_handler(m.group(1), m.group(2))
 
 		return new_line if new_line != None else line
 
@@ -708,18 +721,15 @@ applicable (currently only firewall-cmd calls)."""),
 		# use a special template for the variable value, if necessary
 		template = self.getPortSyntax(key)
 
-		return '{}="{}"\n'.format(key, template.format(port = port))
+		return f'{key}="{template.format(port = port)}"\n'
 
 	def scanPort(self, value):
 		"""Converts the given port string value (from the config file)
 		into an integer. If this is not possible, returns None."""
 
-		value = value.strip('"')
-
 		# we need to support things like "-l 4711"
-		for part in value.split():
-			if part.isdigit():
-				return int(part)
+		m = _PORT_RE.search(value)
+		return int(m.group()) if m else None
 
 	def queryPort(self, key, port):
 		"""interactively queries a new value for the given
@@ -728,10 +738,8 @@ applicable (currently only firewall-cmd calls)."""),
 		returns the chosen port.
 		"""
 
-		query = "Please enter the port number for {} or press "\
-			"ENTER for accepting the suggested port in [].".format(
-				key
-			)
+		query = f"Please enter the port number for {key} or press "\
+			"ENTER for accepting the suggested port in []."
 		query = self.getWrapped(query)
 		print(query)
 		print()
@@ -739,7 +747,7 @@ applicable (currently only firewall-cmd calls)."""),
 		rpc_service = self.cfg_service_names[key]
 
 		while True:
-			print("{} ({}) [{}] > ".format(key, rpc_service, port), end = '')
+			print(f"{key} ({rpc_service}) [{port}] > ", end = '')
 			sys.stdout.flush()
 			reply = sys.stdin.readline()
 			print()
@@ -767,14 +775,12 @@ applicable (currently only firewall-cmd calls)."""),
 		try:
 			port = int(port)
 		except ValueError:
-			print("Invalid port number '{}' encountered".format(
-				port
-			))
+			print(f"Invalid port number '{port}' encountered")
 			print()
 			return None
 
-		if port not in range(1, 2 ** 16):
-			print("Port number '{}' is out of range".format(port))
+		if not (1 <= port < 65536):
+			print(f"Port number '{port}' is out of range")
 			return None
 
 		return port
@@ -793,45 +799,56 @@ applicable (currently only firewall-cmd calls)."""),
 		file. If no static ports are configured then none are
 		returned.
 		"""
-		import functools
 
 		if not isinstance(pattern, self.Pattern):
 			pattern = self.getPatternInfo(pattern)
 
 		self.m_pattern = pattern
 
-		self.m_static_ports = {}
-		cfg = pattern.m_sysconfig_file
+		cfg_ports = self.getCfgPorts(pattern.m_sysconfig_file)
+
+		self.m_static_ports = {
+			key: port for key, port in cfg_ports.items()
+			if key in pattern.m_config_vars
+		}
+
+	def getCfgPorts(self, cfg):
+		"""Returns a dictionary of all key=port assignments found in
+		the given sysconfig file. Parse results are cached per file,
+		so each file is only read once unless it is rewritten."""
+
+		cfg_ports = self.m_cfg_cache.get(cfg)
+
+		if cfg_ports is not None:
+			return cfg_ports
+
+		cfg_ports = {}
+
+		def processCfgItemForParsing(key, val):
+
+			port = self.scanPort(val)
+
+			if port:
+				cfg_ports[key] = port
 
 		try:
 			with open(cfg, 'r') as cfg_fd:
-				for line in cfg_fd.readlines():
+				for line in cfg_fd:
 					self.processCfgLine(
 						line,
-						self.processCfgItemForParsing
+						processCfgItemForParsing
 					)
 		except OSError as e:
 			if e.errno == errno.ENOENT:
 				# probably not installed
 				pass
 
-	def processCfgItemForParsing(self, key, val):
+		self.m_cfg_cache[cfg] = cfg_ports
 
-		if key not in self.m_pattern.m_config_vars:
-			# unknown key
-			return
-
-		port = self.scanPort(val)
-
-		if port:
-			self.m_static_ports[key] = port
+		return cfg_ports
 
 	def callFirewallCmd(self, args, permanent = True, discard = True):
 
-		env = os.environ.copy()
-		# avoid translations or special encodings
-		env["LC_ALL"] = "C"
-
 		if not isinstance(args, list):
 			args = [args]
 
@@ -843,16 +860,28 @@ applicable (currently only firewall-cmd calls)."""),
 		if self.m_verbose:
 			print(">", ' '.join(cmdline))
 
-		with open("/dev/null", 'w') as null:
+		null = subprocess.DEVNULL if discard else None
 
-			return subprocess.call(
-				cmdline,
-				shell = False,
-				close_fds = True,
-				env = env,
-				stdout = null if discard else None,
-				stderr = null if discard else None
-			)
+		return subprocess.run(
+			cmdline,
+			shell = False,
+			close_fds = True,
+			env = self.m_child_env,
+			stdout = null,
+			stderr = null,
+			check = False
+		).returncode
+
+	def isFirewallDRunning(self):
+		"""Returns whether firewalld is running. The result is cached,
+		firewall-cmd is only invoked once per program run."""
+
+		if self.m_firewalld_running is None:
+			self.m_firewalld_running = self.callFirewallCmd(
+				"--state", permanent = False
+			) == 0
+
+		return self.m_firewalld_running
 
 	def checkCallFirewallCmd(self, args, permanent = True):
 
@@ -875,11 +904,9 @@ applicable (currently only firewall-cmd calls)."""),
 		if not missing:
 			return
 
-		error("Error: not all services belonging the the {} "\
+		error(f"Error: not all services belonging the the {pattern.m_label} "\
 			"pattern have been assigned static ports.\n\n"\
-			"Missing configuration items:\n".format(
-				pattern.m_label
-			)
+			"Missing configuration items:\n"
 		)
 
 		for missed in missing:
@@ -891,37 +918,34 @@ applicable (currently only firewall-cmd calls)."""),
 
 		self.checkStaticPortsConfigured(self.m_pattern)
 
-		if self.callFirewallCmd("--state", permanent = False) != 0:
+		if not self.isFirewallDRunning():
 			error("firewalld is not running or firewall-cmd "
 				"was not found")
 			sys.exit(1)
 
-		if self.callFirewallCmd(["--info-service", name]) == 0:
-			error("A firewalld service named '{}' "
-				"is already existing".format(name))
+		# create a new empty service under the given name. firewalld
+		# refuses this if the name is already taken, so no separate
+		# --info-service probe is required beforehand.
+		if self.callFirewallCmd(["--new-service", name]) != 0:
+			error(f"Failed to create a firewalld service named '{name}'. "
+				"Maybe it is already existing?")
 			sys.exit(1)
 
-		# create a new empty service under the given name
-		self.checkCallFirewallCmd(["--new-service", name])
-
-		port_args = []
-
-		for port in self.m_static_ports.values():
-			# for now assume we always need tcp and udp ports
-			port_args.append("--add-port")
-			port_args.append("{}/udp".format(port))
-			port_args.append("--add-port")
-			port_args.append("{}/tcp".format(port))
-
-		for port in self.m_pattern.m_static_ports:
-			port_args.append("--add-port")
-			port_args.append(port)
+		# for now assume we always need tcp and udp ports
+		port_args = [
+			arg for port in self.m_static_ports.values()
+			for arg in (
+				"--add-port", f"{port}/udp",
+				"--add-port", f"{port}/tcp"
+			)
+		] + [
+			arg for port in self.m_pattern.m_static_ports
+			for arg in ("--add-port", port)
+		]
 
 		self.checkCallFirewallCmd(["--service", name] + port_args)
 
-		print("Successfully created new firewalld service '{}':".format(
-			name
-		))
+		print(f"Successfully created new firewalld service '{name}':")
 
 		self.callFirewallCmd(["--info-service", name], discard = False)
 